@@ -8,14 +8,91 @@ Cover slides typically have:
 """
 
 import argparse
-import operator
+import csv
+import json
 import os
+import sqlite3
+from array import array
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import ExitStack, closing
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import pydicom
 from rich_argparse import RichHelpFormatter
 
+# The only elements scoring and reporting look at. Passing these as
+# specific_tags lets pydicom skip decoding every other element.
+META_TAGS = [
+    "ImageType",
+    "InstanceNumber",
+    "BurnedInAnnotation",
+    "SOPClassUID",
+    "ConversionType",
+    "Rows",
+    "Columns",
+    "PatientID",
+    "StudyDescription",
+    "SeriesDescription",
+    "Modality",
+]
+
+# Numeric tags for the same elements. Indexing a Dataset by tag skips the
+# keyword-to-tag dictionary lookup that attribute access goes through.
+TAG_IMAGE_TYPE = 0x00080008
+TAG_SOP_CLASS_UID = 0x00080016
+TAG_MODALITY = 0x00080060
+TAG_CONVERSION_TYPE = 0x00080064
+TAG_STUDY_DESCRIPTION = 0x00081030
+TAG_SERIES_DESCRIPTION = 0x0008103E
+TAG_PATIENT_ID = 0x00100020
+TAG_INSTANCE_NUMBER = 0x00200013
+TAG_BURNED_IN_ANNOTATION = 0x00280301
+TAG_ROWS = 0x00280010
+TAG_COLUMNS = 0x00280011
+
+# Column order for --csv output
+CSV_FIELDS = [
+    "path",
+    "score",
+    "is_cover_slide",
+    "reasons",
+    "PatientID",
+    "StudyDescription",
+    "SeriesDescription",
+    "Modality",
+    "InstanceNumber",
+    "ImageType",
+]
+
+# Rows written to the scan cache per transaction
+CACHE_BATCH_SIZE = 1000
+
+# Bump whenever is_potential_cover_slide, SOP_SCORES or the result layout
+# changes; a cache written under another version is cleared on open
+SCORING_VERSION = 1
+
+# Read-only scan cache connection, one per worker process (see --cache)
+_CACHE = None
+
+# SOP Class UID (or the root of a family of classes) -> (score, reason)
+SOP_SCORES = {
+    # Secondary Capture Image Storage
+    "1.2.840.10008.5.1.4.1.1.7": (4, "SOP Class: Secondary Capture"),
+    # Softcopy Presentation State Storage (Grayscale, Color, ...)
+    "1.2.840.10008.5.1.4.1.1.11": (3, "SOP Class: Presentation State"),
+}
+
+
+def _tag_value(ds: pydicom.Dataset, tag: int, default=None):
+    """Return the value of a tag, or default if it is absent."""
+    return ds[tag].value if tag in ds else default
+
 
 def is_potential_cover_slide(ds: pydicom.Dataset) -> Dict[str, any]:
     """
@@ -26,50 +103,58 @@ def is_potential_cover_slide(ds: pydicom.Dataset) -> Dict[str, any]:
     reasons = []
 
     # Check Image Type
-    if hasattr(ds, "ImageType"):
-        image_type = str(ds.ImageType).upper()
+    if TAG_IMAGE_TYPE in ds:
+        image_type = ds[TAG_IMAGE_TYPE].value or ""
+        # Join the raw values rather than str() the MultiValue, which builds
+        # a quoted list repr on every file just to be searched
+        if not isinstance(image_type, str):
+            image_type = "\\".join(image_type)
+        image_type = image_type.upper()
         if "SECONDARY" in image_type:
             score += 3
             reasons.append("Image Type: SECONDARY")
         if "LOCALIZER" in image_type or "SCOUT" in image_type:
             score += 5
-            reasons.append(f"Image Type: {image_type}")
+            reasons.append(
+                f"Image Type: {str(ds[TAG_IMAGE_TYPE].value).upper()}"
+            )
         if "SCREEN" in image_type or "SAVE" in image_type:
             score += 4
             reasons.append("Image Type: SCREEN SAVE")
 
     # Check Instance Number (cover slides often first)
-    if hasattr(ds, "InstanceNumber"):
-        if ds.InstanceNumber == 1:
+    if TAG_INSTANCE_NUMBER in ds:
+        if ds[TAG_INSTANCE_NUMBER].value == 1:
             score += 2
             reasons.append("Instance Number: 1 (first in series)")
 
     # Check for Burned In Annotation
-    if hasattr(ds, "BurnedInAnnotation"):
-        if ds.BurnedInAnnotation == "YES":
+    if TAG_BURNED_IN_ANNOTATION in ds:
+        if ds[TAG_BURNED_IN_ANNOTATION].value == "YES":
             score += 5
             reasons.append("Burned In Annotation: YES")
 
     # Check SOP Class UID for Secondary Capture
-    if hasattr(ds, "SOPClassUID"):
-        # Secondary Capture Image Storage
-        if ds.SOPClassUID == "1.2.840.10008.5.1.4.1.1.7":
-            score += 4
-            reasons.append("SOP Class: Secondary Capture")
-        # Grayscale Softcopy Presentation State
-        elif "1.2.840.10008.5.1.4.1.1.11" in ds.SOPClassUID:
-            score += 3
-            reasons.append("SOP Class: Presentation State")
+    if TAG_SOP_CLASS_UID in ds:
+        sop_class_uid = str(ds[TAG_SOP_CLASS_UID].value)
+        # Exact class first, then its parent (e.g. ...1.1.11.1 -> ...1.1.11)
+        sop_score = SOP_SCORES.get(sop_class_uid) or SOP_SCORES.get(
+            sop_class_uid.rpartition(".")[0]
+        )
+        if sop_score:
+            score += sop_score[0]
+            reasons.append(sop_score[1])
 
     # Check Conversion Type
-    if hasattr(ds, "ConversionType"):
-        if ds.ConversionType in ("WSD", "SI", "DV"):
+    if TAG_CONVERSION_TYPE in ds:
+        conversion_type = ds[TAG_CONVERSION_TYPE].value
+        if conversion_type in ("WSD", "SI", "DV"):
             score += 3
-            reasons.append(f"Conversion Type: {ds.ConversionType}")
+            reasons.append(f"Conversion Type: {conversion_type}")
 
     # Check for unusual dimensions (screenshots might have different aspect ratios)
-    if hasattr(ds, "Rows") and hasattr(ds, "Columns"):
-        aspect_ratio = ds.Columns / ds.Rows
+    if TAG_ROWS in ds and TAG_COLUMNS in ds:
+        aspect_ratio = ds[TAG_COLUMNS].value / ds[TAG_ROWS].value
         if aspect_ratio > 1.5 or aspect_ratio < 0.6:
             score += 1
             reasons.append(f"Unusual aspect ratio: {aspect_ratio:.2f}")
@@ -77,10 +162,12 @@ def is_potential_cover_slide(ds: pydicom.Dataset) -> Dict[str, any]:
     return {"score": score, "reasons": reasons, "is_cover_slide": score >= 3}
 
 
-def analyze_dicom_file(file_path: Path) -> Dict:
+def analyze_dicom_file(file_path: str) -> Dict:
     """Analyze a single DICOM file."""
     try:
-        ds = pydicom.dcmread(file_path, stop_before_pixels=True)
+        ds = pydicom.dcmread(
+            file_path, stop_before_pixels=True, specific_tags=META_TAGS
+        )
         analysis = is_potential_cover_slide(ds)
 
         return {
@@ -89,32 +176,136 @@ def analyze_dicom_file(file_path: Path) -> Dict:
             "is_cover_slide": analysis["is_cover_slide"],
             "reasons": analysis["reasons"],
             "metadata": {
-                "PatientID": getattr(ds, "PatientID", "N/A"),
-                "StudyDescription": getattr(ds, "StudyDescription", "N/A"),
-                "SeriesDescription": getattr(ds, "SeriesDescription", "N/A"),
-                "Modality": getattr(ds, "Modality", "N/A"),
-                "InstanceNumber": getattr(ds, "InstanceNumber", "N/A"),
-                "ImageType": str(getattr(ds, "ImageType", "N/A")),
+                "PatientID": _tag_value(ds, TAG_PATIENT_ID, "N/A"),
+                "StudyDescription": _tag_value(ds, TAG_STUDY_DESCRIPTION, "N/A"),
+                "SeriesDescription": _tag_value(ds, TAG_SERIES_DESCRIPTION, "N/A"),
+                "Modality": _tag_value(ds, TAG_MODALITY, "N/A"),
+                "InstanceNumber": _tag_value(ds, TAG_INSTANCE_NUMBER, "N/A"),
+                "ImageType": str(_tag_value(ds, TAG_IMAGE_TYPE, "N/A")),
             },
         }
     except Exception as e:
         return {"path": str(file_path), "error": str(e)}
 
 
-def find_dicom_files(root_dir: Path, extensions: List[str] = None) -> List[Path]:
-    """Recursively find all .dat files in directory."""
+def _open_cache(cache_path: str) -> sqlite3.Connection:
+    """Open (creating if needed) the scan cache database for writing."""
+    conn = sqlite3.connect(cache_path)
+    # WAL lets the parse workers read while the main process writes. The
+    # cache is rebuildable, so durability is traded for speed.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, result TEXT)"
+    )
+    # Results scored under different rules are stale
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCORING_VERSION:
+        conn.execute("DELETE FROM cache")
+        conn.execute(f"PRAGMA user_version={SCORING_VERSION}")
+    conn.commit()
+    return conn
+
+
+def _write_cache(conn: sqlite3.Connection, rows: List[Tuple]):
+    """Store a batch of (path, mtime, size, result JSON) rows in one transaction."""
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+
+
+def _init_cache_reader(cache_path: str):
+    """Open a read-only cache connection for this worker process."""
+    global _CACHE
+    # as_uri() percent-encodes characters such as ?, # and % in the path
+    cache_uri = Path(cache_path).resolve().as_uri() + "?mode=ro"
+    _CACHE = sqlite3.connect(cache_uri, uri=True)
+
+
+def analyze_cached(file_path: str) -> Dict:
+    """
+    Analyze a DICOM file, reusing the cached result if it is unchanged.
+    Failed parses are cached too, so unreadable files are not re-read on
+    every run. Fresh results carry "mtime" and "size" so the caller can
+    cache them.
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError as e:
+        return {"path": str(file_path), "error": str(e)}
+
+    row = _CACHE.execute(
+        "SELECT result FROM cache WHERE path = ? AND mtime = ? AND size = ?",
+        (str(file_path), st.st_mtime, st.st_size),
+    ).fetchone()
+    if row is not None:
+        return json.loads(row[0])
+
+    result = analyze_dicom_file(file_path)
+    result["mtime"] = st.st_mtime
+    result["size"] = st.st_size
+    return result
+
+
+def _scan_directory(
+    directory: str, extensions: Tuple[str, ...]
+) -> Tuple[List[str], List[str]]:
+    """List one directory, returning its subdirectories and matching files."""
+    subdirs = []
+    matches = []
+
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                # Filter on the dirent name; is_dir() above uses the cached
+                # dirent type, so no file is stat()ed or wrapped in a Path
+                elif entry.name.lower().endswith(extensions):
+                    matches.append(entry.path)
+    except OSError:
+        pass
+
+    return subdirs, matches
+
+
+def _csv_row(result: Dict) -> Dict:
+    """Flatten an analyze_dicom_file result into one CSV row."""
+    return {
+        "path": result["path"],
+        "score": result["score"],
+        "is_cover_slide": result["is_cover_slide"],
+        "reasons": "; ".join(result["reasons"]),
+        **result["metadata"],
+    }
+
+
+def find_dicom_files(
+    root_dir: Path, extensions: List[str] = None, threads: int = 60
+) -> List[str]:
+    """
+    Recursively find all .dat files in directory.
+    Directories are listed from a thread pool so that slow listdir calls on
+    network filesystems overlap instead of running one after another.
+    """
     if extensions is None:
         extensions = [".dat"]
+    extensions = tuple(ext.lower() for ext in extensions)
 
     dicom_files = []
 
-    for root, dirs, files in os.walk(root_dir):
-        for file in files:
-            file_path = Path(root) / file
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = {executor.submit(_scan_directory, str(root_dir), extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, matches = future.result()
+                dicom_files.extend(matches)
+                for subdir in subdirs:
+                    pending.add(executor.submit(_scan_directory, subdir, extensions))
 
-            # Only match .dat files
-            if file_path.suffix.lower() in extensions:
-                dicom_files.append(file_path)
+    # Listings complete in whatever order the threads finish; sort so the
+    # file list, CSV rows and order of equal-score hits are stable per run
+    dicom_files.sort()
 
     return dicom_files
 
@@ -137,6 +328,24 @@ def main():
         default=3,
         help="Minimum score to consider a file as cover slide (default: 3)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes for parsing (default: CPU count)",
+    )
+    parser.add_argument(
+        "--csv",
+        type=str,
+        default=None,
+        help="Write the score, reasons and metadata of every file to this CSV",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="SQLite file caching results by path, mtime and size across runs",
+    )
 
     args = parser.parse_args()
 
@@ -153,24 +362,68 @@ def main():
     print(f"\nFound {len(dicom_files)} DICOM files")
     print("=" * 80)
 
-    results = []
-    for file_path in dicom_files:
-        result = analyze_dicom_file(file_path)
-        if "error" not in result:
-            results.append(result)
+    # Header parsing is independent per file, so fan it out across cores.
+    # analyze_dicom_file returns plain dicts, which pickle cheaply. Results
+    # are consumed as they arrive: every row goes straight to the CSV and
+    # only the path and score of each cover slide are kept, as two parallel
+    # columns rather than one dict per file.
+    cover_paths = []
+    cover_scores = array("i")
+    with ExitStack() as stack:
+        writer = None
+        if args.csv:
+            csv_file = stack.enter_context(open(args.csv, "w", newline=""))
+            writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+
+        # Unchanged files are answered from the cache; new results are
+        # written back in batches by this (the only writing) process
+        cache = None
+        cache_rows = []
+        worker = analyze_dicom_file
+        initializer, initargs = None, ()
+        if args.cache:
+            cache = stack.enter_context(closing(_open_cache(args.cache)))
+            worker = analyze_cached
+            initializer, initargs = _init_cache_reader, (args.cache,)
+
+        executor = stack.enter_context(
+            ProcessPoolExecutor(
+                max_workers=args.workers, initializer=initializer, initargs=initargs
+            )
+        )
+        for result in executor.map(worker, dicom_files, chunksize=64):
+            if "mtime" in result:
+                mtime, size = result.pop("mtime"), result.pop("size")
+                cache_rows.append(
+                    (result["path"], mtime, size, json.dumps(result, default=str))
+                )
+                if len(cache_rows) >= CACHE_BATCH_SIZE:
+                    _write_cache(cache, cache_rows)
+                    cache_rows = []
+            if "error" in result:
+                continue
+            if writer is not None:
+                writer.writerow(_csv_row(result))
+            if result["score"] >= args.min_score:
+                cover_paths.append(result["path"])
+                cover_scores.append(result["score"])
+
+        if cache_rows:
+            _write_cache(cache, cache_rows)
 
     # Sort by score (highest first)
-    results.sort(key=operator.itemgetter("score"), reverse=True)
+    order = sorted(
+        range(len(cover_scores)), key=cover_scores.__getitem__, reverse=True
+    )
 
     # Display results
-    cover_slides = [r for r in results if r["score"] >= args.min_score]
-
-    if cover_slides:
-        print(f"\n🎯 COVER SLIDES FOUND ({len(cover_slides)}):")
+    if order:
+        print(f"\n🎯 COVER SLIDES FOUND ({len(order)}):")
         print("=" * 80)
 
-        for result in cover_slides:
-            print(result["path"])
+        for i in order:
+            print(cover_paths[i])
     else:
         print("\n❌ No cover slides found")
 
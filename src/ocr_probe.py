@@ -1,138 +1,442 @@
 # Enhanced DICOM OCR test script with preprocessing
-# uv run ocr_probe.py path/to/file.dat
+# uv run ocr_probe.py path/to/file.dat [more files or folders ...]
 
-import sys
+import argparse
+import os
+import tempfile
 import warnings
+from functools import partial
+from multiprocessing import Pool, SimpleQueue
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List
 
 import cv2
 import numpy as np
 import pydicom
-import pytesseract
-from paddleocr import PaddleOCR
 from PIL import Image
+from rich_argparse import RichHelpFormatter
+
+from cover_scout import analyze_dicom_file, find_dicom_files
+
+if TYPE_CHECKING:
+    from paddleocr import PaddleOCR
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# Path to one DICOM file
-dcm_path = sys.argv[1] if len(sys.argv) > 1 else "sample.dat"
+# Metadata scores in [OCR_MIN_SCORE, OCR_MAX_SCORE) are inconclusive and get
+# OCR'd; anything below is clearly a body slice, anything above a cover slide.
+OCR_MIN_SCORE = 3
+OCR_MAX_SCORE = 7
+
+# Normalized images with a pixel standard deviation below this are treated
+# as low contrast and CLAHE-enhanced before OCR
+LOW_CONTRAST_STD = 30
+
+# Built once rather than per file
+_CLAHE = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+# Models used when PaddleOCR has to run on the CPU. Naming a model makes
+# PaddleOCR ignore lang, so the English recognizer is named explicitly too;
+# otherwise it falls back to the heavy multilingual server recognizer.
+CPU_DET_MODEL = "PP-OCRv5_mobile_det"
+CPU_REC_MODEL = "en_PP-OCRv5_mobile_rec"
+
+# One PaddleOCR per process. Loading the model takes seconds, so it is built
+# by _init_ocr the first time a file needs OCR and reused for every file
+# after that; metadata-only runs never load it.
+_OCR = None
+
+
+def _pin_gpu(gpu_queue: SimpleQueue):
+    """
+    Take one device id from gpu_queue and pin this process to that GPU.
+    Must run before Paddle initializes CUDA, e.g. as a Pool initializer.
+    """
+    os.environ["CUDA_VISIBLE_DEVICES"] = gpu_queue.get()
+
+
+def _gpu_available() -> bool:
+    """Whether paddlepaddle has a CUDA build and can see at least one GPU."""
+    # Imported here so _pin_gpu can set CUDA_VISIBLE_DEVICES before Paddle loads
+    import paddle
+
+    return (
+        paddle.device.is_compiled_with_cuda()
+        and paddle.device.cuda.device_count() > 0
+    )
+
+
+def _init_ocr():
+    """
+    Load the PaddleOCR model for this process. On a GPU it runs through
+    TensorRT in FP16 when TensorRT is installed, plain FP32 otherwise.
+    """
+    global _OCR
+    # paddleocr loads Paddle too, so it is also imported only after pinning
+    from paddleocr import PaddleOCR
+
+    if _gpu_available():
+        # PaddleOCR only honours precision="fp16" on the TensorRT backend
+        try:
+            _OCR = PaddleOCR(
+                use_angle_cls=True,
+                lang="en",
+                device="gpu",
+                use_tensorrt=True,
+                precision="fp16",
+            )
+        except Exception:
+            _OCR = PaddleOCR(use_angle_cls=True, lang="en", device="gpu")
+    else:
+        # No CUDA build of paddlepaddle or no visible GPU: run on the CPU
+        # with the lighter mobile models
+        _OCR = PaddleOCR(
+            use_angle_cls=True,
+            device="cpu",
+            text_detection_model_name=CPU_DET_MODEL,
+            text_recognition_model_name=CPU_REC_MODEL,
+        )
 
-print(f"Processing: {dcm_path}")
-print("=" * 80)
 
-# Read the DICOM file
-ds = pydicom.dcmread(dcm_path)
+def preprocess(
+    pixel_array: np.ndarray, save_images: bool = False, thorough: bool = False
+) -> List:
+    """
+    Normalize pixel data and build the (name, RGB image) variants to OCR.
+    By default that is a single image, CLAHE-enhanced only if it is low
+    contrast; thorough=True builds all five preprocessing variants.
+    """
+    # Normalize to 0-255 in a single float32 buffer
+    pixel_min = pixel_array.min()
+    pixel_range = float(pixel_array.max()) - float(pixel_min)
+    normalized = np.empty(pixel_array.shape, dtype=np.float32)
+    np.subtract(pixel_array, pixel_min, out=normalized, dtype=np.float32)
+    if pixel_range:
+        normalized *= 255.0 / pixel_range
+    pixel_array = normalized.astype(np.uint8, copy=False)
 
-# Extract image array
-pixel_array = ds.pixel_array
+    # Original normalized version
+    if len(pixel_array.shape) == 2:
+        original_rgb = cv2.cvtColor(pixel_array, cv2.COLOR_GRAY2RGB)
+    else:
+        original_rgb = pixel_array
 
-# Normalize to 0-255
-pixel_array = (pixel_array - np.min(pixel_array)) / (
-    np.max(pixel_array) - np.min(pixel_array)
-)
-pixel_array = (pixel_array * 255).astype(np.uint8)
+    preprocessed_images = []
 
-# Save original normalized version
-if len(pixel_array.shape) == 2:
-    original_rgb = np.stack([pixel_array] * 3, axis=-1)
-else:
-    original_rgb = pixel_array
+    if not thorough:
+        # PaddleOCR does its own preprocessing, so one image is enough; only
+        # flat, low-contrast slides get a CLAHE boost first
+        if len(pixel_array.shape) == 2 and pixel_array.std() < LOW_CONTRAST_STD:
+            enhanced_rgb = cv2.cvtColor(_CLAHE.apply(pixel_array), cv2.COLOR_GRAY2RGB)
+            preprocessed_images.append(("CLAHE Enhanced", enhanced_rgb, "02_clahe.png"))
+        else:
+            preprocessed_images.append(("Original", original_rgb, "01_original.png"))
 
-Image.fromarray(original_rgb).save("01_original.png")
+        if save_images:
+            for _, img, filename in preprocessed_images:
+                Image.fromarray(img).save(filename)
 
-# Try multiple preprocessing approaches
-preprocessed_images = []
+        return [(name, img) for name, img, _ in preprocessed_images]
 
-# 1. Original (no preprocessing)
-preprocessed_images.append(("Original", original_rgb))
+    # Try multiple preprocessing approaches
+    # 1. Original (no preprocessing)
+    preprocessed_images.append(("Original", original_rgb, "01_original.png"))
 
-# 2. Contrast enhancement (CLAHE)
-clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-enhanced = clahe.apply(pixel_array)
-enhanced_rgb = np.stack([enhanced] * 3, axis=-1)
-preprocessed_images.append(("CLAHE Enhanced", enhanced_rgb))
-Image.fromarray(enhanced_rgb).save("02_clahe.png")
+    # 2. Contrast enhancement (CLAHE)
+    enhanced = _CLAHE.apply(pixel_array)
+    enhanced_rgb = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
+    preprocessed_images.append(("CLAHE Enhanced", enhanced_rgb, "02_clahe.png"))
 
-# 3. Binary threshold (Otsu's method)
-_, binary = cv2.threshold(pixel_array, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-binary_rgb = np.stack([binary] * 3, axis=-1)
-preprocessed_images.append(("Binary Threshold", binary_rgb))
-Image.fromarray(binary_rgb).save("03_binary.png")
+    # 3. Binary threshold (Otsu's method)
+    _, binary = cv2.threshold(
+        pixel_array, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+    )
+    binary_rgb = cv2.cvtColor(binary, cv2.COLOR_GRAY2RGB)
+    preprocessed_images.append(("Binary Threshold", binary_rgb, "03_binary.png"))
 
-# 4. Inverted binary (for white text on black background)
-inverted = cv2.bitwise_not(binary)
-inverted_rgb = np.stack([inverted] * 3, axis=-1)
-preprocessed_images.append(("Inverted Binary", inverted_rgb))
-Image.fromarray(inverted_rgb).save("04_inverted.png")
+    # 4. Inverted binary (for white text on black background)
+    inverted = cv2.bitwise_not(binary)
+    inverted_rgb = cv2.cvtColor(inverted, cv2.COLOR_GRAY2RGB)
+    preprocessed_images.append(("Inverted Binary", inverted_rgb, "04_inverted.png"))
 
-# 5. Morphological operations to clean up noise
-kernel = np.ones((2, 2), np.uint8)
-morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-morph_rgb = np.stack([morph] * 3, axis=-1)
-preprocessed_images.append(("Morphological", morph_rgb))
-Image.fromarray(morph_rgb).save("05_morphological.png")
+    # 5. Morphological operations to clean up noise
+    kernel = np.ones((2, 2), np.uint8)
+    morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    morph_rgb = cv2.cvtColor(morph, cv2.COLOR_GRAY2RGB)
+    preprocessed_images.append(("Morphological", morph_rgb, "05_morphological.png"))
 
-print(f"Saved {len(preprocessed_images)} preprocessed versions")
-print("=" * 80)
+    if save_images:
+        for _, img, filename in preprocessed_images:
+            Image.fromarray(img).save(filename)
 
-# Test OCR on all preprocessed versions
-print("\nTesting OCR on all preprocessed images...")
-print("=" * 80)
+    return [(name, img) for name, img, _ in preprocessed_images]
 
-ocr = PaddleOCR(use_angle_cls=True, lang="en")
 
-all_results = []
+def probe_ocr(
+    dcm_path: str,
+    ocr: "PaddleOCR" = None,
+    save_images: bool = False,
+    thorough: bool = False,
+) -> Dict:
+    """
+    Run PaddleOCR and Tesseract over the preprocessed image(s) of one file.
+    Uses this process's shared PaddleOCR unless one is passed in.
+    """
+    # Imported here, like paddleocr in _init_ocr, so metadata-only runs
+    # never pay for loading the OCR engines
+    import pytesseract
 
-for name, img_array in preprocessed_images:
-    print(f"\n--- {name} ---")
+    if ocr is None:
+        if _OCR is None:
+            _init_ocr()
+        ocr = _OCR
 
-    # PaddleOCR
-    paddle_results = ocr.predict(img_array)
-    paddle_text = []
+    try:
+        ds = pydicom.dcmread(dcm_path)
+        preprocessed_images = preprocess(ds.pixel_array, save_images, thorough)
+    except Exception as e:
+        return {"path": str(dcm_path), "error": str(e)}
 
-    if paddle_results and len(paddle_results) > 0:
-        for result in paddle_results:
-            if result.get("rec_text"):
-                text = result.get("rec_text", "")
-                conf = result.get("rec_score", 0)
-                paddle_text.append(f"{text} ({conf:.2f})")
+    # PaddleOCR: run every variant through the model in one batched call
+    all_paddle = ocr.predict([img for _, img in preprocessed_images])
 
-    # Tesseract
+    # Tesseract: one process over a multi-page TIFF, pages split on form feeds
     try:
-        img_pil = Image.fromarray(img_array)
-        tess_result = pytesseract.image_to_string(img_pil).strip()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tiff_path = os.path.join(tmp_dir, "variants.tif")
+            pages = [Image.fromarray(img) for _, img in preprocessed_images]
+            pages[0].save(tiff_path, save_all=True, append_images=pages[1:])
+            all_tess = pytesseract.image_to_string(tiff_path).split("\f")
     except Exception:
-        tess_result = ""
-
-    # Display results
-    if paddle_text or tess_result:
-        if paddle_text:
-            print(f"  PaddleOCR: {' | '.join(paddle_text)}")
-        if tess_result:
-            print(f"  Tesseract: {tess_result[:100]}...")  # Truncate long results
-
-        all_results.append({
-            "method": name,
-            "paddle": paddle_text,
-            "tesseract": tess_result
-        })
+        all_tess = []
+    all_tess += [""] * (len(preprocessed_images) - len(all_tess))
+
+    methods = []
+    for (name, _), paddle_result, tess_page in zip(
+        preprocessed_images, all_paddle, all_tess
+    ):
+        # PaddleOCR
+        paddle_text = []
+
+        if paddle_result and paddle_result.get("rec_text"):
+            text = paddle_result.get("rec_text", "")
+            conf = paddle_result.get("rec_score", 0)
+            paddle_text.append(f"{text} ({conf:.2f})")
+
+        # Tesseract
+        tess_result = tess_page.strip()
+
+        methods.append(
+            {"method": name, "paddle": paddle_text, "tesseract": tess_result}
+        )
+
+    return {"path": str(dcm_path), "methods": methods}
+
+
+def probe_meta(dcm_path: str) -> Dict:
+    """
+    Score a file from its metadata alone. Only the header is read, so pixel
+    data is never loaded or decompressed.
+    """
+    analysis = analyze_dicom_file(dcm_path)
+    if "error" in analysis:
+        return analysis
+
+    return {
+        "path": str(dcm_path),
+        "score": analysis["score"],
+        "reasons": analysis["reasons"],
+    }
+
+
+def scout_then_ocr(dcm_path: str, thorough: bool = False) -> Dict:
+    """
+    Score a file from its metadata first and only run OCR when the score is
+    inconclusive. OCR costs orders of magnitude more than a header read.
+    """
+    report = probe_meta(dcm_path)
+    if "error" in report:
+        return report
+
+    if OCR_MIN_SCORE <= report["score"] < OCR_MAX_SCORE:
+        ocr_report = probe_ocr(dcm_path, thorough=thorough)
+        # Keep an OCR failure apart from "error", which means the metadata
+        # could not be read, so the score and reasons still get reported
+        if "error" in ocr_report:
+            report["ocr_error"] = ocr_report["error"]
+        else:
+            report["methods"] = ocr_report["methods"]
+
+    return report
+
+
+def _verdict(score: int) -> str:
+    """Describe what a metadata score says on its own."""
+    if score >= OCR_MAX_SCORE:
+        return "cover slide"
+    if score < OCR_MIN_SCORE:
+        return "not a cover slide"
+    return "inconclusive (needs OCR)"
+
+
+def print_report(report: Dict):
+    """Print the per-method results and summary for one probed file."""
+    print(f"Processing: {report['path']}")
+    print("=" * 80)
+
+    if "error" in report:
+        print(f"Error: {report['error']}")
+        return
+
+    if "score" in report:
+        print(f"Metadata score: {report['score']}")
+        for reason in report["reasons"]:
+            print(f"  - {reason}")
+        if "ocr_error" in report:
+            print(f"OCR error: {report['ocr_error']}")
+        if "methods" not in report:
+            print(f"Metadata verdict: {_verdict(report['score'])}")
+            return
+
+    methods = report["methods"]
+
+    # Test OCR on all preprocessed versions
+    print(f"\nTesting OCR on {len(methods)} preprocessed images...")
+    print("=" * 80)
+
+    all_results = []
+
+    for result in methods:
+        print(f"\n--- {result['method']} ---")
+
+        paddle_text = result["paddle"]
+        tess_result = result["tesseract"]
+
+        # Display results
+        if paddle_text or tess_result:
+            if paddle_text:
+                print(f"  PaddleOCR: {' | '.join(paddle_text)}")
+            if tess_result:
+                print(f"  Tesseract: {tess_result[:100]}...")  # Truncate long results
+
+            all_results.append(result)
+        else:
+            print("  No text detected")
+
+    print("\n" + "=" * 80)
+    print("SUMMARY")
+    print("=" * 80)
+
+    if all_results:
+        print(
+            f"\nText found in {len(all_results)} out of {len(methods)} "
+            "preprocessing methods:"
+        )
+        for result in all_results:
+            print(f"\n✓ {result['method']}")
+            if result['paddle']:
+                print(f"  PaddleOCR: {len(result['paddle'])} text regions")
+            if result['tesseract']:
+                print(f"  Tesseract: {len(result['tesseract'])} characters")
+    else:
+        print("\n❌ No text detected in any preprocessing method")
+        print("\nPossible reasons:")
+        print("  - This is a diagnostic image without text overlays")
+        print("  - Text is embedded in DICOM metadata, not pixel data")
+        print("  - Image is a cover slide candidate that needs different handling")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run PaddleOCR and Tesseract on DICOM cover slide candidates",
+        formatter_class=RichHelpFormatter,
+    )
+    parser.add_argument(
+        "paths",
+        type=str,
+        nargs="*",
+        default=["sample.dat"],
+        help="DICOM files or folders to probe (default: sample.dat)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each loading its own model (default: 1)",
+    )
+    parser.add_argument(
+        "--gpus",
+        type=str,
+        default=None,
+        help="Comma-separated GPU ids to spread OCR workers over, e.g. 0,1",
+    )
+    parser.add_argument(
+        "--thorough",
+        action="store_true",
+        help="OCR all five preprocessing variants instead of one adaptive image",
+    )
+    parser.add_argument(
+        "--scout",
+        action="store_true",
+        help=(
+            "Score metadata first and only OCR files scoring "
+            f"{OCR_MIN_SCORE}-{OCR_MAX_SCORE - 1}"
+        ),
+    )
+    parser.add_argument(
+        "--meta-only",
+        action="store_true",
+        help="Score metadata only; never read pixel data or load the OCR model",
+    )
+
+    args = parser.parse_args()
+
+    dcm_paths = []
+    for path in args.paths:
+        if Path(path).is_dir():
+            dcm_paths.extend(find_dicom_files(Path(path), [".dat", ".dcm"]))
+        else:
+            dcm_paths.append(path)
+
+    # Hand out GPU ids round-robin, one per OCR process
+    gpu_queue = None
+    if args.gpus:
+        gpu_ids = args.gpus.split(",")
+        gpu_queue = SimpleQueue()
+        for i in range(max(args.workers, 1)):
+            gpu_queue.put(gpu_ids[i % len(gpu_ids)])
+
+    if args.meta_only:
+        worker = probe_meta
+    elif args.scout:
+        worker = partial(scout_then_ocr, thorough=args.thorough)
     else:
-        print("  No text detected")
-
-print("\n" + "=" * 80)
-print("SUMMARY")
-print("=" * 80)
-
-if all_results:
-    print(f"\nText found in {len(all_results)} out of {len(preprocessed_images)} preprocessing methods:")
-    for result in all_results:
-        print(f"\n✓ {result['method']}")
-        if result['paddle']:
-            print(f"  PaddleOCR: {len(result['paddle'])} text regions")
-        if result['tesseract']:
-            print(f"  Tesseract: {len(result['tesseract'])} characters")
-else:
-    print("\n❌ No text detected in any preprocessing method")
-    print("\nPossible reasons:")
-    print("  - This is a diagnostic image without text overlays")
-    print("  - Text is embedded in DICOM metadata, not pixel data")
-    print("  - Image is a cover slide candidate that needs different handling")
+        worker = partial(probe_ocr, thorough=args.thorough)
+
+    # Preprocessed PNGs are only useful (and only unambiguous) for one file
+    if len(dcm_paths) == 1 and not (args.scout or args.meta_only):
+        if gpu_queue is not None:
+            _pin_gpu(gpu_queue)
+        print_report(worker(dcm_paths[0], save_images=True))
+        return
+
+    if args.workers > 1:
+        initializer, initargs = None, ()
+        if gpu_queue is not None:
+            initializer, initargs = _pin_gpu, (gpu_queue,)
+        with Pool(
+            processes=args.workers, initializer=initializer, initargs=initargs
+        ) as pool:
+            for report in pool.imap_unordered(worker, dcm_paths):
+                print_report(report)
+                print()
+    else:
+        if gpu_queue is not None:
+            _pin_gpu(gpu_queue)
+        for dcm_path in dcm_paths:
+            print_report(worker(dcm_path))
+            print()
+
+
+if __name__ == "__main__":
+    main()